@@ -1,35 +1,58 @@
 import os
+import math
 import logging
 from flask import Flask, jsonify, Response, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
 from detection.detector import ObjectDetector
+from detection.encoding import FORMATS, parse_variant
+from detection.pose import PoseListener, parse_poses
+from detection.projection import load_calibration, merge_calibration, validate_calibration
+from detection.tiling import validate_roi_polygons
+from detection.serialization import (FAST_JSON, OBJECT_FORMATS, available_formats,
+                                     dumps_json, encode_objects)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, used for jsonify when it is installed"""
+    
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode('utf-8')
+
 # Create Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+if FAST_JSON:
+    app.json = FastJSONProvider(app)
+
 # Initialize our object detector
 detector = None
 
 # Default RTSP URL - replace with your actual RTSP camera URL
 DEFAULT_RTSP_URL = os.environ.get('RTSP_URL', 'rtsp://192.168.129.115:1935/')
 
+# Optional camera calibration file used to place detections on the map
+CALIBRATION_PATH = os.environ.get('CAMERA_CALIBRATION')
+
+# Number of detection snapshots kept for /objects?since= and ?window= queries
+HISTORY_SIZE = int(os.environ.get('DETECTION_HISTORY_SIZE', 300))
+
+# Optional UDP port for binary robot pose batches
+POSE_UDP_PORT = os.environ.get('POSE_UDP_PORT')
+pose_listener = None
+
 @app.route('/start', methods=['POST'])
 def start_detection():
     """Start the object detection service"""
-    global detector
+    global detector, pose_listener
     
     try:
-        # If detector is already running, stop it first
-        if detector and detector.is_running:
-            detector.stop()
-            
         # Get parameters from request
         data = request.json if request.is_json else {}
         
@@ -47,17 +70,50 @@ def start_detection():
             logger.info(f"Starting detection with local camera ID: {camera_id}")
             rtsp_url = None
         
-        # Initialize detector with YOLO model
-        model_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'yolov8n.pt')
+        # Optional tiled inference / ROI settings
+        tiled = data.get('tiled')
+        if tiled is not None and not isinstance(tiled, bool):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid tiled: must be true or false'
+            }), 400
+        try:
+            roi_polygons = validate_roi_polygons(data.get('roi_polygons'))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid roi_polygons: {str(e)}'
+            }), 400
         
-        detector = ObjectDetector(
-            model_path=model_path,
-            camera_id=camera_id,
-            rtsp_url=rtsp_url if use_rtsp else None
-        )
+        if detector:
+            # Reuse the loaded model and just swap the video source
+            detector.switch_source(camera_id=camera_id, rtsp_url=rtsp_url)
+            if tiled is not None:
+                detector.tiled = tiled
+            if 'roi_polygons' in data:
+                detector.set_roi(roi_polygons)
+        else:
+            # Initialize detector with YOLO model
+            model_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'yolov8n.pt')
+            
+            detector = ObjectDetector(
+                model_path=model_path,
+                camera_id=camera_id,
+                rtsp_url=rtsp_url,
+                tiled=bool(tiled),
+                roi_polygons=roi_polygons,
+                calibration=load_calibration(CALIBRATION_PATH) if CALIBRATION_PATH else None,
+                history_size=HISTORY_SIZE
+            )
+            
+            # Feed UDP poses straight into the detector's pose buffer
+            if POSE_UDP_PORT:
+                pose_listener = PoseListener(detector.poses, port=int(POSE_UDP_PORT))
+                pose_listener.start()
         
-        # Start detection in background thread
-        detector.start()
+        # Start detection in background thread (no-op if already running)
+        if not detector.is_running:
+            detector.start()
         
         return jsonify({
             'status': 'success',
@@ -99,14 +155,31 @@ def stop_detection():
 
 @app.route('/frame', methods=['GET'])
 def get_frame():
-    """Get the current video frame"""
+    """
+    Get the current video frame.
+    Optional query parameters: width (pixels), quality (1-100), format (jpeg/webp)
+    """
     global detector
     
     try:
+        try:
+            width, quality, fmt = parse_variant(
+                request.args.get('width'),
+                request.args.get('quality'),
+                request.args.get('format')
+            )
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid frame parameters: {str(e)}'
+            }), 400
+        
         if detector and detector.is_running:
-            frame_jpg = detector.get_frame_jpg()
-            if frame_jpg:
-                return Response(frame_jpg, mimetype='image/jpeg')
+            frame_data = detector.get_frame_encoded(width=width, quality=quality, fmt=fmt)
+            if frame_data:
+                response = Response(frame_data, mimetype=FORMATS[fmt])
+                response.headers['X-Frame-Stale'] = 'true' if detector.is_stale() else 'false'
+                return response
             else:
                 return jsonify({
                     'status': 'error',
@@ -127,16 +200,83 @@ def get_frame():
 
 @app.route('/objects', methods=['GET'])
 def get_objects():
-    """Get the currently detected objects"""
+    """
+    Get the currently detected objects.
+    Optional query parameters:
+        since: Only return snapshots newer than this sequence number
+        window: Aggregate detections over the last N seconds (one entry per track) - not combinable with since
+        format: json (default), columnar, msgpack or binary - also negotiated via the Accept header
+    """
     global detector
     
     try:
-        if detector and detector.is_running:
-            objects = detector.get_detected_objects()
+        since = request.args.get('since')
+        window = request.args.get('window')
+        
+        # Explicit format wins over the Accept header
+        fmt = request.args.get('format')
+        if fmt is None:
+            mimetypes = [OBJECT_FORMATS[f] for f in available_formats()]
+            best = request.accept_mimetypes.best_match(mimetypes, default=OBJECT_FORMATS['json'])
+            fmt = next(f for f in available_formats() if OBJECT_FORMATS[f] == best)
+        elif fmt not in available_formats():
             return jsonify({
-                'status': 'success',
-                'objects': objects
-            })
+                'status': 'error',
+                'message': f"Unsupported format '{fmt}' (expected one of: {', '.join(available_formats())})"
+            }), 400
+        
+        try:
+            since = int(since) if since is not None else None
+            window = float(window) if window is not None else None
+            if window is not None and (not math.isfinite(window) or window <= 0):
+                raise ValueError('window must be a positive number of seconds')
+            if since is not None and window is not None:
+                raise ValueError('since and window cannot be combined')
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid query parameters: {str(e)}'
+            }), 400
+        
+        if detector and detector.is_running:
+            if since is not None:
+                snapshots, truncated = detector.get_objects_since(since)
+                payload = {
+                    'status': 'success',
+                    'seq': snapshots[-1]['seq'] if snapshots else detector.get_latest_seq(),
+                    'snapshots': snapshots,
+                    'truncated': truncated,
+                    'stale': detector.is_stale()
+                }
+            else:
+                if window is not None:
+                    objects = detector.get_objects_window(window)
+                else:
+                    objects = detector.get_detected_objects()
+                
+                payload = {
+                    'status': 'success',
+                    'seq': detector.get_latest_seq(),
+                    'objects': objects,
+                    'stale': detector.is_stale()
+                }
+            
+            # Existing clients get the row-per-object format unchanged
+            if fmt == 'json':
+                response = jsonify(payload)
+            else:
+                try:
+                    body = encode_objects(payload, fmt)
+                except ValueError as e:
+                    return jsonify({
+                        'status': 'error',
+                        'message': str(e)
+                    }), 400
+                response = Response(body, mimetype=OBJECT_FORMATS[fmt])
+            
+            # The body depends on the Accept header, so caches must key on it
+            response.vary.add('Accept')
+            return response
         else:
             return jsonify({
                 'status': 'error',
@@ -150,6 +290,89 @@ def get_objects():
             'message': f'Failed to get objects: {str(e)}'
         }), 500
 
+@app.route('/calibration', methods=['GET', 'POST'])
+def calibration():
+    """Get or replace the camera calibration used to place detections on the map"""
+    global detector
+    
+    try:
+        if not detector:
+            return jsonify({
+                'status': 'error',
+                'message': 'Detector not initialized'
+            }), 400
+        
+        if request.method == 'GET':
+            return jsonify({
+                'status': 'success',
+                'calibration': detector.projector.calibration
+            })
+        
+        data = request.json
+        if not data:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid request data. Calibration required.'
+            }), 400
+        
+        # Unspecified keys keep their current values
+        try:
+            calibration = validate_calibration(merge_calibration(detector.projector.calibration, data))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid calibration: {str(e)}'
+            }), 400
+        
+        rebuilt = detector.set_calibration(calibration)
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Calibration updated' if rebuilt else 'Calibration unchanged',
+            'calibration': detector.projector.calibration
+        })
+        
+    except Exception as e:
+        logger.error(f"Error updating calibration: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to update calibration: {str(e)}'
+        }), 500
+
+@app.route('/pose', methods=['POST'])
+def add_pose():
+    """Record a batch of robot poses (GPS/odometry) used to place detections on the map"""
+    global detector
+    
+    try:
+        if not detector:
+            return jsonify({
+                'status': 'error',
+                'message': 'Detector not initialized'
+            }), 400
+        
+        data = request.get_json(silent=True)
+        try:
+            poses = parse_poses(data or {})
+        except (ValueError, TypeError, IndexError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid pose data: {str(e)}'
+            }), 400
+        
+        stored = detector.add_poses(poses)
+        return jsonify({
+            'status': 'success',
+            'stored': stored
+        })
+        
+    except Exception as e:
+        logger.error(f"Error adding poses: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to add poses: {str(e)}'
+        }), 500
+
 @app.route('/add_obstacle', methods=['POST'])
 def add_obstacle():
     """Add a detected obstacle to the map"""
@@ -182,7 +405,8 @@ def health_check():
     """Simple health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'detection_running': detector.is_running if detector else False
+        'detection_running': detector.is_running if detector else False,
+        'capture': detector.get_status() if detector else None
     })
 
 @app.route('/config', methods=['GET'])
@@ -195,7 +419,9 @@ def get_config():
                 'using_rtsp': detector.rtsp_url is not None,
                 'rtsp_url': detector.rtsp_url or 'Not using RTSP',
                 'camera_id': detector.camera_id,
-                'is_running': detector.is_running
+                'is_running': detector.is_running,
+                'tiled': detector.tiled,
+                'roi_polygons': detector.roi_polygons
             }
         })
     else:
@@ -206,7 +432,9 @@ def get_config():
                 'using_rtsp': None,
                 'rtsp_url': DEFAULT_RTSP_URL,
                 'camera_id': 0,
-                'is_running': False
+                'is_running': False,
+                'tiled': False,
+                'roi_polygons': None
             }
         })
 
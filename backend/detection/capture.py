@@ -0,0 +1,287 @@
+import cv2
+import time
+import random
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureSupervisor:
+    """
+    Owns the video capture for a detector and keeps it alive in a background thread.
+    The source can be swapped while running, and lost connections are retried
+    forever with exponential backoff and jitter. The last good frame stays
+    available (and is reported as stale) while the source is down.
+    """
+
+    def __init__(self, camera_id=0, rtsp_url=None, stale_after=5.0, initial_backoff=0.5, max_backoff=30.0):
+        """
+        Initialize the capture supervisor.
+
+        Args:
+            camera_id (int): Camera device ID - used only if rtsp_url is None
+            rtsp_url (str): URL for RTSP stream
+            stale_after (float): Seconds without a new frame before the source is considered lost
+            initial_backoff (float): Delay in seconds before the first reconnection attempt
+            max_backoff (float): Upper bound in seconds for the reconnection delay
+        """
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.stale_after = stale_after
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        # Internal state
+        self.is_running = False
+        self.thread = None
+        self.cap = None
+        # Bumped on every start()/stop() so a capture thread left over from an earlier
+        # run (e.g. still blocked opening an RTSP stream) exits without touching shared state
+        self.run_id = 0
+        self.source_generation = 0
+        self.reconnect_attempts = 0
+        self.last_error = None
+
+        # Latest frame (protected by condition)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_seq = 0
+        self.frame_time = None
+
+        # Set to interrupt a backoff sleep (source switch or stop)
+        self.wake = threading.Event()
+
+    def start(self):
+        """Start the capture thread"""
+        if self.is_running:
+            return False
+
+        with self.condition:
+            self.run_id += 1
+            run_id = self.run_id
+            self.is_running = True
+            # Fresh event per run so stop() of an earlier run can't be cleared by this one
+            self.wake = threading.Event()
+
+        self.thread = threading.Thread(target=self._capture_loop, args=(run_id, self.wake))
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info("Capture supervisor started")
+        return True
+
+    def stop(self):
+        """Stop the capture thread and release the video source"""
+        with self.condition:
+            self.run_id += 1
+            self.is_running = False
+        self.wake.set()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+            if self.thread.is_alive():
+                # Probably blocked opening the source; it will exit on its own once that returns
+                logger.warning("Capture thread still busy, leaving it to exit in the background")
+            self.thread = None
+
+        with self.condition:
+            self.cap = None
+            self.frame = None
+            self.frame_time = None
+            self.condition.notify_all()
+
+        logger.info("Capture supervisor stopped")
+        return True
+
+    def set_source(self, camera_id=0, rtsp_url=None):
+        """
+        Switch to a new video source without stopping the capture thread.
+        The last frame from the old source stays available until the new one delivers.
+
+        Args:
+            camera_id (int): Camera device ID - used only if rtsp_url is None
+            rtsp_url (str): URL for RTSP stream
+        """
+        with self.condition:
+            self.camera_id = camera_id
+            self.rtsp_url = rtsp_url
+            self.source_generation += 1
+            self.reconnect_attempts = 0
+
+        logger.info(f"Switching video source to {self.describe_source()}")
+        self.wake.set()
+
+    def describe_source(self):
+        """Get a human readable description of the current source"""
+        return self.rtsp_url if self.rtsp_url else f"Camera ID {self.camera_id}"
+
+    def wait_for_frame(self, last_seq, timeout=0.5):
+        """
+        Wait for a frame newer than last_seq.
+
+        Args:
+            last_seq (int): Sequence number of the last frame the caller processed
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            tuple: (frame, seq, capture_time), or None if no new frame arrived in time
+        """
+        with self.condition:
+            # frame is cleared on stop() while frame_seq keeps counting, so check both
+            self.condition.wait_for(
+                lambda: (self.frame is not None and self.frame_seq > last_seq) or not self.is_running,
+                timeout=timeout
+            )
+            if self.frame is None or self.frame_seq <= last_seq:
+                return None
+            return self.frame, self.frame_seq, self.frame_time
+
+    def is_stale(self):
+        """Check whether the latest frame is older than stale_after (or missing)"""
+        with self.condition:
+            if self.frame_time is None:
+                return True
+            return (time.time() - self.frame_time) > self.stale_after
+
+    def get_status(self):
+        """Get the current connection status"""
+        with self.condition:
+            frame_age = time.time() - self.frame_time if self.frame_time is not None else None
+        return {
+            'source': self.describe_source(),
+            'connected': self.cap is not None and frame_age is not None and frame_age <= self.stale_after,
+            'stale': frame_age is None or frame_age > self.stale_after,
+            'frame_age': frame_age,
+            'reconnect_attempts': self.reconnect_attempts,
+            'last_error': self.last_error
+        }
+
+    def _open(self, camera_id, rtsp_url):
+        """Open a video source, returning the capture or None on failure"""
+        if rtsp_url:
+            logger.info(f"Connecting to RTSP stream: {rtsp_url}")
+            # Configure OpenCV for RTSP streams
+            cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+
+            # Set RTSP buffer size and other relevant parameters
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)  # Small buffer to reduce latency
+
+            # Enable TCP for more reliable streaming
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'H264'))
+
+            # Try to set lower resolution for better performance (might not work with all cameras)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        else:
+            logger.info(f"Opening local webcam with ID: {camera_id}")
+            cap = cv2.VideoCapture(camera_id)
+
+        if not cap.isOpened():
+            cap.release()
+            return None
+
+        return cap
+
+    def _release(self, cap):
+        """Release a capture, unpublishing it only if it is still the current one"""
+        cap.release()
+        with self.condition:
+            if self.cap is cap:
+                self.cap = None
+
+    def _is_current(self, run_id):
+        """Check whether a capture thread still belongs to the active run"""
+        return self.is_running and run_id == self.run_id
+
+    def _backoff(self, wake):
+        """Sleep before the next reconnection attempt, unless woken by a source switch or stop"""
+        # Cap the exponent so a source that stays down for hours can't overflow the delay
+        delay = min(self.max_backoff, self.initial_backoff * (2 ** min(self.reconnect_attempts, 32)))
+        # Equal jitter so several robots don't hammer a recovering camera in lockstep
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.reconnect_attempts += 1
+
+        logger.info(f"Reconnecting to {self.describe_source()} in {delay:.1f}s (attempt {self.reconnect_attempts})")
+        wake.wait(delay)
+        wake.clear()
+
+    def _capture_loop(self, run_id, wake):
+        """
+        Capture loop that runs in a separate thread.
+        The capture is owned by this thread; it is only published as self.cap while
+        the thread belongs to the current run.
+        """
+        logger.info("Capture loop started")
+
+        cap = None
+        generation = None
+        last_read_time = time.time()
+
+        while self._is_current(run_id):
+            try:
+                # (Re)open the source if it changed or the connection was dropped
+                if generation != self.source_generation or cap is None:
+                    if cap is not None:
+                        self._release(cap)
+                        cap = None
+
+                    with self.condition:
+                        generation = self.source_generation
+                        camera_id, rtsp_url = self.camera_id, self.rtsp_url
+
+                    cap = self._open(camera_id, rtsp_url)
+                    if cap is None:
+                        self.last_error = f"Could not open video source: {self.describe_source()}"
+                        logger.warning(self.last_error)
+                        self._backoff(wake)
+                        continue
+
+                    # Source was switched or this run was stopped while we were connecting
+                    with self.condition:
+                        current = self._is_current(run_id) and generation == self.source_generation
+                        if current:
+                            self.cap = cap
+                    if not current:
+                        cap.release()
+                        cap = None
+                        continue
+
+                    last_read_time = time.time()
+                    logger.info(f"Connected to {self.describe_source()}")
+
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    if (time.time() - last_read_time) > self.stale_after:
+                        self.last_error = f"No frames received for {self.stale_after:.0f} seconds"
+                        logger.warning(f"{self.last_error}, reconnecting")
+                        self._release(cap)
+                        cap = None
+                        self._backoff(wake)
+                    else:
+                        # Sleep briefly to avoid tight loop if camera is not working
+                        time.sleep(0.1)
+                    continue
+
+                last_read_time = time.time()
+                self.reconnect_attempts = 0
+                self.last_error = None
+
+                with self.condition:
+                    if not self._is_current(run_id):
+                        break
+                    self.frame = frame
+                    self.frame_seq += 1
+                    self.frame_time = last_read_time
+                    self.condition.notify_all()
+
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error in capture loop: {str(e)}")
+                if cap is not None:
+                    self._release(cap)
+                    cap = None
+                self._backoff(wake)
+
+        if cap is not None:
+            self._release(cap)
+        logger.info("Capture loop ended")
@@ -6,6 +6,13 @@ import numpy as np
 from io import BytesIO
 from ultralytics import YOLO
 
+from detection.capture import CaptureSupervisor
+from detection.encoding import FrameEncoder, parse_variant
+from detection.history import DetectionHistory
+from detection.pose import PoseBuffer
+from detection.projection import GroundProjector, offsets_to_latlon
+from detection.tiling import make_tiles, build_roi_mask, apply_roi_mask, filter_by_roi, merge_detections
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,7 +23,11 @@ class ObjectDetector:
     The detection runs in a separate thread and results are available via methods.
     """
     
-    def __init__(self, model_path, camera_id=0, rtsp_url=None, confidence_threshold=0.5, obstacle_classes=None):
+    def __init__(self, model_path, camera_id=0, rtsp_url=None, confidence_threshold=0.5, obstacle_classes=None,
+                 frame_cache_size=32, stale_after=5.0, tiled=False, tile_size=640, tile_overlap=0.2,
+                 tile_full_frame=True, merge_threshold=0.5, roi_polygons=None, calibration=None,
+                 camera_lat=10.903831, camera_lon=76.899839, camera_heading=0.0, pose_buffer_size=1024,
+                 history_size=300):
         """
         Initialize the object detector.
         
@@ -26,12 +37,56 @@ class ObjectDetector:
             rtsp_url (str): URL for RTSP stream (e.g. rtsp://username:password@ip_address:port/stream)
             confidence_threshold (float): Minimum confidence for detection (0-1)
             obstacle_classes (list): Classes to be considered as obstacles (default: person, car, truck, etc.)
+            frame_cache_size (int): Maximum number of encoded frame variants kept in memory
+            stale_after (float): Seconds without a new frame before results are marked stale
+            tiled (bool): Run inference on overlapping tiles to find small objects in high-resolution frames
+            tile_size (int): Tile edge length in pixels (also the model input size in tiled mode)
+            tile_overlap (float): Fraction of each tile shared with its neighbour (0-1)
+            tile_full_frame (bool): Also run a downscaled full frame in the tiled batch so large objects aren't split
+            merge_threshold (float): Overlap (intersection over the smaller box) above which detections
+                of the same class from different tiles are merged into one
+            roi_polygons (list): Region-of-interest polygons as lists of normalised [x, y] points.
+                Pixels outside them (e.g. sky, the robot's own body) are never processed
+            calibration (dict): Camera intrinsics and ground-plane mounting/homography used to
+                place detections on the map (default: nominal forward-facing camera)
+            camera_lat (float): Latitude of the camera
+            camera_lon (float): Longitude of the camera
+            camera_heading (float): Direction the camera faces, in degrees clockwise from north
+            pose_buffer_size (int): Number of robot poses kept for timestamp-aligned projection.
+                Until any pose is received, camera_lat/camera_lon/camera_heading are used
+            history_size (int): Number of detection snapshots kept for incremental/windowed queries
         """
         self.model_path = model_path
         self.camera_id = camera_id
         self.rtsp_url = rtsp_url
         self.confidence_threshold = confidence_threshold
         
+        # Tiled inference settings
+        self.tiled = tiled
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_full_frame = tile_full_frame
+        self.merge_threshold = merge_threshold
+        
+        # ROI mask is rasterised lazily for each frame size
+        self.roi_polygons = roi_polygons
+        self.roi_mask = None
+        self.roi_mask_key = None
+        self.roi_version = 0
+        
+        # Pixel-to-ground lookup table, rebuilt only when the calibration changes
+        self.projector = GroundProjector(calibration)
+        
+        # Fallback camera pose used until the robot reports its own.
+        # Defaults are fixed coordinates near Arjuna Statue at Amrita for testing
+        self.camera_lat = camera_lat
+        self.camera_lon = camera_lon
+        self.camera_heading = camera_heading
+        
+        # Robot poses (GPS/odometry), looked up at each frame's capture time.
+        # The camera is assumed to face the robot's heading
+        self.poses = PoseBuffer(capacity=pose_buffer_size)
+        
         # Default obstacle classes - can be customized
         self.obstacle_classes = obstacle_classes or [
             'person', 'bicycle', 'car', 'motorcycle', 'bus', 
@@ -41,16 +96,23 @@ class ObjectDetector:
         # Internal state
         self.is_running = False
         self.thread = None
-        self.cap = None
         self.model = None
-        self.connection_attempts = 0
-        self.max_connection_attempts = 5
+        
+        # Video capture runs in its own thread and reconnects on its own
+        self.capture = CaptureSupervisor(camera_id=camera_id, rtsp_url=rtsp_url, stale_after=stale_after)
         
         # Shared data (protected by lock)
         self.lock = threading.Lock()
         self.current_frame = None
+        self.frame_seq = 0
         self.detected_objects = []
         
+        # Recent detection snapshots, so slow clients don't miss short-lived obstacles
+        self.history = DetectionHistory(capacity=history_size)
+        
+        # Encoded frame variants, shared by all clients
+        self.encoder = FrameEncoder(max_entries=frame_cache_size)
+        
         # Load YOLO model
         try:
             logger.info(f"Loading YOLO model from {model_path}")
@@ -61,54 +123,22 @@ class ObjectDetector:
             raise
     
     def start(self):
-        """Start the detection thread"""
+        """Start the capture and detection threads"""
         if self.is_running:
             logger.warning("Detection already running")
             return False
         
-        try:
-            # Determine source - RTSP URL or webcam
-            if self.rtsp_url:
-                logger.info(f"Using RTSP stream from: {self.rtsp_url}")
-                # Configure OpenCV for RTSP streams
-                self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-                
-                # Set RTSP buffer size and other relevant parameters
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)  # Small buffer to reduce latency
-                
-                # Enable TCP for more reliable streaming
-                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'H264'))
-                
-                # Try to set lower resolution for better performance (might not work with all cameras)
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            else:
-                logger.info(f"Using local webcam with ID: {self.camera_id}")
-                self.cap = cv2.VideoCapture(self.camera_id)
-            
-            if not self.cap.isOpened():
-                logger.error(f"Failed to open video source")
-                if self.rtsp_url:
-                    raise ValueError(f"Could not connect to RTSP stream: {self.rtsp_url}")
-                else:
-                    raise ValueError(f"Could not open camera {self.camera_id}")
-            
-            # Start thread
-            self.is_running = True
-            self.connection_attempts = 0
-            self.thread = threading.Thread(target=self._detection_loop)
-            self.thread.daemon = True
-            self.thread.start()
-            logger.info("Detection started successfully")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error starting detection: {str(e)}")
-            self.is_running = False
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-            raise
+        # The capture supervisor keeps retrying in the background, so an
+        # unreachable source doesn't prevent detection from starting
+        self.capture.start()
+        
+        # Start thread
+        self.is_running = True
+        self.thread = threading.Thread(target=self._detection_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Detection started using {self.capture.describe_source()}")
+        return True
     
     def stop(self):
         """Stop the detection thread"""
@@ -118,143 +148,245 @@ class ObjectDetector:
             self.thread.join(timeout=5.0)
             self.thread = None
         
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        self.capture.stop()
             
         with self.lock:
             self.current_frame = None
             self.detected_objects = []
+        self.history.clear()
+        self.encoder.clear()
             
         logger.info("Detection stopped")
         return True
+    
+    def switch_source(self, camera_id=0, rtsp_url=None):
+        """
+        Switch the video source of a running detector without reloading the model.
+        The last frame and detections stay available (marked stale) until the new source delivers.
+        
+        Args:
+            camera_id (int): Camera device ID - used only if rtsp_url is None
+            rtsp_url (str): URL for RTSP stream
+        """
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.capture.set_source(camera_id=camera_id, rtsp_url=rtsp_url)
+    
+    def is_stale(self):
+        """Check whether the latest frame and detections are out of date"""
+        return self.capture.is_stale()
+    
+    def get_status(self):
+        """Get the capture/connection status"""
+        return self.capture.get_status()
+        
+    def set_roi(self, roi_polygons):
+        """
+        Replace the region-of-interest polygons used for detection.
+        
+        Args:
+            roi_polygons (list): Polygons as lists of normalised [x, y] points, or None to process the whole frame
+        """
+        self.roi_polygons = roi_polygons
+        # Bumped after the polygons are replaced so the detection loop rebuilds its mask
+        self.roi_version += 1
+    
+    def set_calibration(self, calibration):
+        """
+        Replace the camera calibration used for geo-projection.
+        
+        Args:
+            calibration (dict): Camera calibration (see detection.projection.load_calibration)
+        
+        Returns:
+            bool: True if the lookup table had to be rebuilt
+        """
+        return self.projector.set_calibration(calibration)
+    
+    def add_poses(self, poses):
+        """
+        Record a batch of robot poses.
+        
+        Args:
+            poses (array-like): N x 4 array of (timestamp, lat, lon, heading) rows
+        
+        Returns:
+            int: Number of poses stored
+        """
+        return self.poses.add_batch(poses)
+    
+    def get_pose(self, timestamp):
+        """Get the camera pose (lat, lon, heading) at a given time"""
+        pose = self.poses.interpolate(timestamp)
+        if pose is None:
+            return self.camera_lat, self.camera_lon, self.camera_heading
+        return pose
+    
+    def _project(self, boxes, frame_shape, capture_time):
+        """
+        Get the map position of each detection from where its box touches the ground.
+        
+        Args:
+            boxes (ndarray): N x 4 array of (x1, y1, x2, y2) boxes
+            frame_shape (tuple): Shape of the frame the boxes come from
+            capture_time (float): When the frame was captured, used to look up the robot pose
+        
+        Returns:
+            ndarray: N x 2 array of (latitude, longitude)
+        """
+        # Bottom centre of each box is the point resting on the ground
+        feet = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+        offsets = self.projector.project(feet, frame_shape)
+        lat, lon, heading = self.get_pose(capture_time)
+        return offsets_to_latlon(offsets, lat, lon, heading)
+    
+    def _get_roi_mask(self, frame_shape):
+        """Get the ROI mask for this frame, rebuilding it only when the polygons or frame size change"""
+        # Read the version before the polygons so a concurrent set_roi can only cause an extra rebuild
+        version = self.roi_version
+        polygons = self.roi_polygons
+        if not polygons:
+            return None
+        key = (version, frame_shape[:2])
+        if key != self.roi_mask_key:
+            self.roi_mask = build_roi_mask(frame_shape, polygons)
+            self.roi_mask_key = key
+        return self.roi_mask
+    
+    def _infer(self, frame):
+        """
+        Run the model on a frame, either whole or as a batch of overlapping tiles.
+        
+        Args:
+            frame (ndarray): BGR frame
+        
+        Returns:
+            tuple: (boxes, scores, class_ids) numpy arrays in frame coordinates,
+                filtered by confidence threshold and ROI
+        """
+        roi_mask = self._get_roi_mask(frame.shape)
+        image = apply_roi_mask(frame, roi_mask)
+        
+        if self.tiled:
+            tiles = make_tiles(image.shape, self.tile_size, self.tile_overlap, roi_mask)
+            crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+            offsets = [(x1, y1) for x1, y1, _, _ in tiles]
+            
+            # Skip the full-frame pass when a single tile already covers the whole frame
+            covers_frame = len(tiles) == 1 and tiles[0] == (0, 0, image.shape[1], image.shape[0])
+            if self.tile_full_frame and not covers_frame:
+                crops.append(image)
+                offsets.append((0, 0))
+            
+            if not crops:
+                empty = np.zeros(0, dtype=np.float32)
+                return np.zeros((0, 4), dtype=np.float32), empty, empty
+            
+            # All tiles go through the model as a single batch
+            results = self.model(crops, imgsz=self.tile_size, conf=self.confidence_threshold, verbose=False)
+        else:
+            results = self.model(image, conf=self.confidence_threshold, verbose=False)
+            offsets = [(0, 0)]
+        
+        boxes, scores, class_ids = [], [], []
+        for result, (dx, dy) in zip(results, offsets):
+            result_boxes = result.boxes.xyxy.cpu().numpy()
+            result_boxes[:, [0, 2]] += dx
+            result_boxes[:, [1, 3]] += dy
+            boxes.append(result_boxes)
+            scores.append(result.boxes.conf.cpu().numpy())
+            class_ids.append(result.boxes.cls.cpu().numpy())
+        
+        boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32)
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+        class_ids = np.concatenate(class_ids) if class_ids else np.zeros(0, dtype=np.float32)
         
+        # Drop detections centred outside the ROI
+        keep = filter_by_roi(boxes, roi_mask) & (scores >= self.confidence_threshold)
+        boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        
+        # Tiles overlap, so the same object can be reported by several of them
+        if self.tiled:
+            boxes, scores, class_ids = merge_detections(boxes, scores, class_ids,
+                                                        self.confidence_threshold, self.merge_threshold)
+        
+        return boxes, scores, class_ids
+    
     def _detection_loop(self):
         """Main detection loop that runs in a separate thread"""
         logger.info("Detection loop started")
         
-        # For simulating GPS locations - in a real system these would come from sensors
-        # These are fixed coordinates from the map for testing
-        base_lat = 10.903831  # Near Arjuna Statue at Amrita
-        base_lon = 76.899839
-        
         frame_count = 0
         start_time = time.time()
-        connection_retry_delay = 2.0  # Seconds to wait between reconnection attempts
-        last_frame_time = time.time()
+        last_seq = 0
         
         while self.is_running:
             try:
-                # Check if we need to reconnect to the stream
-                current_time = time.time()
-                if self.rtsp_url and (current_time - last_frame_time) > 5.0:  # No frames for 5 seconds
-                    logger.warning("No frames received for 5 seconds, attempting to reconnect")
-                    
-                    # Increment attempts counter
-                    self.connection_attempts += 1
-                    
-                    # Check if we've reached max attempts
-                    if self.connection_attempts >= self.max_connection_attempts:
-                        logger.error(f"Failed to reconnect after {self.max_connection_attempts} attempts")
-                        self.is_running = False
-                        break
-                    
-                    # Release old capture and create a new one
-                    if self.cap:
-                        self.cap.release()
-                    
-                    logger.info(f"Reconnecting to RTSP stream (attempt {self.connection_attempts})...")
-                    self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-                    
-                    # Reset timer
-                    last_frame_time = current_time
-                    time.sleep(connection_retry_delay)
+                # Wait for the capture supervisor to deliver a new frame
+                captured = self.capture.wait_for_frame(last_seq, timeout=0.5)
+                if captured is None:
                     continue
                 
-                # Capture frame
-                ret, frame = self.cap.read()
-                if not ret or frame is None:
-                    logger.warning("Failed to capture frame")
-                    # Sleep briefly to avoid tight loop if camera is not working
-                    time.sleep(0.1)
-                    continue
-                
-                # Update frame timestamp
-                last_frame_time = time.time()
+                frame, last_seq, capture_time = captured
                 
-                # Reset connection attempts counter on successful frame
-                self.connection_attempts = 0
+                # Annotations are drawn in place, so work on our own copy
+                frame = frame.copy()
                 
                 # Process frame with YOLO model (every 3 frames to improve performance)
                 frame_count += 1
                 if frame_count % 3 == 0:
-                    # Get detections
-                    results = self.model(frame)
+                    # Get detections (already filtered by confidence and ROI)
+                    boxes, scores, class_ids = self._infer(frame)
+                    
+                    # Place all detections on the map in one lookup
+                    positions = self._project(boxes, frame.shape, capture_time)
                     
                     # Process results and update detected objects
                     objects = []
                     
-                    for result in results:
-                        for i, (box, score, class_id) in enumerate(zip(result.boxes.xyxy, 
-                                                                   result.boxes.conf, 
-                                                                   result.boxes.cls)):
-                            if score >= self.confidence_threshold:
-                                # Extract coordinates
-                                x1, y1, x2, y2 = box.cpu().numpy().astype(int)
-                                class_name = result.names[int(class_id)]
-                                
-                                # Calculate center of detection
-                                center_x = (x1 + x2) / 2
-                                center_y = (y1 + y2) / 2
-                                
-                                # Normalize to [0,1] range
-                                norm_x = center_x / frame.shape[1]
-                                norm_y = center_y / frame.shape[0]
-                                
-                                # Simulate GPS coordinates based on position in frame
-                                # Just an example - in a real system these would come from sensors
-                                # Adjust these offsets based on your specific map and camera setup
-                                lat_offset = (0.5 - norm_y) * 0.002  # Adjust as needed
-                                lon_offset = (norm_x - 0.5) * 0.002  # Adjust as needed
-                                
-                                latitude = base_lat + lat_offset
-                                longitude = base_lon + lon_offset
-                                
-                                # Calculate size/radius based on bounding box size
-                                # This is a simple approximation - should be calibrated in a real system
-                                width = (x2 - x1)
-                                height = (y2 - y1)
-                                size = (width + height) / 4  # Quarter of average dimension
-                                
-                                # Convert size to approximate meters based on image proportion
-                                # This is a very rough approximation and should be calibrated
-                                size_meters = max(3, size / 20)
-                                
-                                # Check if this class is considered an obstacle
-                                is_obstacle = class_name.lower() in self.obstacle_classes
-                                
-                                # Create an object entry
-                                obj = {
-                                    'id': i,
-                                    'class': class_name,
-                                    'confidence': float(score),
-                                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                                    'position': [float(latitude), float(longitude)],
-                                    'is_obstacle': is_obstacle,
-                                    'radius': float(size_meters)
-                                }
-                                objects.append(obj)
-                                
-                                # Draw detection on frame
-                                color = (0, 0, 255) if is_obstacle else (0, 255, 0)
-                                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                                cv2.putText(frame, f"{class_name} {score:.2f}", 
-                                            (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 
-                                            0.5, color, 2)
+                    for i, (box, score, class_id) in enumerate(zip(boxes, scores, class_ids)):
+                        # Extract coordinates
+                        x1, y1, x2, y2 = box.astype(int)
+                        class_name = self.model.names[int(class_id)]
+                        
+                        latitude, longitude = positions[i]
+                        
+                        # Calculate size/radius based on bounding box size
+                        # This is a simple approximation - should be calibrated in a real system
+                        width = (x2 - x1)
+                        height = (y2 - y1)
+                        size = (width + height) / 4  # Quarter of average dimension
+                        
+                        # Convert size to approximate meters based on image proportion
+                        # This is a very rough approximation and should be calibrated
+                        size_meters = max(3, size / 20)
+                        
+                        # Check if this class is considered an obstacle
+                        is_obstacle = class_name.lower() in self.obstacle_classes
+                        
+                        # Create an object entry
+                        obj = {
+                            'id': i,
+                            'class': class_name,
+                            'confidence': float(score),
+                            'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                            'position': [float(latitude), float(longitude)],
+                            'is_obstacle': is_obstacle,
+                            'radius': float(size_meters)
+                        }
+                        objects.append(obj)
+                        
+                        # Draw detection on frame
+                        color = (0, 0, 255) if is_obstacle else (0, 255, 0)
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                        cv2.putText(frame, f"{class_name} {score:.2f}", 
+                                    (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 
+                                    0.5, color, 2)
                     
                     # Update shared state with lock
                     with self.lock:
                         self.detected_objects = objects
+                    self.history.add(objects, capture_time)
                 
                 # Draw frame counter
                 elapsed_time = time.time() - start_time
@@ -267,9 +399,10 @@ class ObjectDetector:
                     cv2.putText(frame, "RTSP Stream", (10, 60),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
                 
-                # Update current frame with lock
+                # Update current frame with lock (frame is not modified after this point)
                 with self.lock:
-                    self.current_frame = frame.copy()
+                    self.current_frame = frame
+                    self.frame_seq += 1
                 
             except Exception as e:
                 logger.error(f"Error in detection loop: {str(e)}")
@@ -278,25 +411,67 @@ class ObjectDetector:
                 
         logger.info("Detection loop ended")
     
-    def get_frame_jpg(self):
+    def get_frame_jpg(self, width=None, quality=None):
         """Get the current frame as JPEG bytes"""
+        return self.get_frame_encoded(width=width, quality=quality, fmt='jpeg')
+    
+    def get_frame_encoded(self, width=None, quality=None, fmt='jpeg'):
+        """
+        Get the current frame encoded as the requested variant.
+        Each variant is encoded at most once per frame and cached for other clients.
+        
+        Args:
+            width (int): Target width in pixels, or None for full resolution
+            quality (int): Encoder quality (1-100), or None for the default
+            fmt (str): Output format ('jpeg' or 'webp')
+        
+        Returns:
+            bytes: Encoded frame, or None if no frame is available
+        """
+        width, quality, fmt = parse_variant(width, quality, fmt)
+        
         with self.lock:
             if self.current_frame is None:
                 return None
             
-            frame = self.current_frame.copy()
+            # The stored frame is never modified in place, so no copy is needed
+            frame = self.current_frame
+            seq = self.frame_seq
             
-        # Convert frame to JPEG
-        ret, jpeg = cv2.imencode('.jpg', frame)
-        if not ret:
-            return None
-            
-        return jpeg.tobytes()
+        return self.encoder.encode(frame, seq, width=width, quality=quality, fmt=fmt)
     
     def get_detected_objects(self):
         """Get the detected objects from the latest processed frame"""
         with self.lock:
             return self.detected_objects.copy()
+    
+    def get_latest_seq(self):
+        """Get the sequence number of the latest detection snapshot"""
+        return self.history.last_seq
+    
+    def get_objects_since(self, seq):
+        """
+        Get detection snapshots newer than a sequence number.
+        
+        Args:
+            seq (int): Last sequence number the client has seen
+        
+        Returns:
+            tuple: (snapshots, truncated) - see DetectionHistory.since
+        """
+        return self.history.since(seq)
+    
+    def get_objects_window(self, seconds):
+        """
+        Get detections from the last few seconds, aggregated per track.
+        
+        Args:
+            seconds (float): Length of the window
+        
+        Returns:
+            list: One object per track with its highest confidence
+        """
+        return self.history.window(seconds, time.time())
 
 # Demo code - only runs if this file is executed directly
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import cv2
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# TurboJPEG is optional - fall back to OpenCV's encoder if it isn't installed
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+logger = logging.getLogger(__name__)
+
+# Supported output formats and their mimetypes
+FORMATS = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+DEFAULT_QUALITY = 80
+MAX_WIDTH = 4096
+
+
+def parse_variant(width=None, quality=None, fmt=None):
+    """
+    Validate and normalise frame variant parameters (e.g. from a query string).
+
+    Args:
+        width (int|str): Target width in pixels, or None for full resolution
+        quality (int|str): Encoder quality (1-100), or None for the default
+        fmt (str): Output format ('jpeg', 'jpg' or 'webp'), or None for JPEG
+
+    Returns:
+        tuple: (width, quality, fmt) ready to be used as a cache key
+
+    Raises:
+        ValueError: If any parameter is out of range or unsupported
+    """
+    fmt = (fmt or 'jpeg').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+
+    if width is not None:
+        width = int(width)
+        if width <= 0 or width > MAX_WIDTH:
+            raise ValueError(f"Width must be between 1 and {MAX_WIDTH}")
+
+    quality = DEFAULT_QUALITY if quality is None else int(quality)
+    if quality < 1 or quality > 100:
+        raise ValueError("Quality must be between 1 and 100")
+
+    return width, quality, fmt
+
+
+class FrameEncoder:
+    """
+    Encodes frames into size/quality/format variants.
+    Each (frame sequence, variant) pair is encoded once and kept in a bounded
+    LRU cache, so any number of clients polling the same frame share the work.
+    """
+
+    def __init__(self, max_entries=32):
+        """
+        Initialize the frame encoder.
+
+        Args:
+            max_entries (int): Maximum number of encoded variants kept in the cache
+        """
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+        # Encodes in progress, so concurrent misses on the same variant wait instead of re-encoding
+        self.pending = {}
+
+        self.turbo = None
+        if TurboJPEG is not None:
+            try:
+                self.turbo = TurboJPEG()
+                logger.info("Using TurboJPEG for frame encoding")
+            except Exception as e:
+                logger.warning(f"TurboJPEG unavailable, falling back to OpenCV: {str(e)}")
+
+    def encode(self, frame, seq, width=None, quality=DEFAULT_QUALITY, fmt='jpeg'):
+        """
+        Get an encoded variant of a frame, encoding it only on a cache miss.
+
+        Args:
+            frame (ndarray): BGR frame to encode (must not be modified afterwards)
+            seq (int): Sequence number identifying the frame
+            width (int): Target width in pixels, or None for full resolution
+            quality (int): Encoder quality (1-100)
+            fmt (str): Output format ('jpeg' or 'webp')
+
+        Returns:
+            bytes: Encoded image, or None if encoding failed
+        """
+        key = (seq, width, quality, fmt)
+
+        with self.lock:
+            data = self.cache.get(key)
+            if data is not None:
+                self.cache.move_to_end(key)
+                return data
+
+            future = self.pending.get(key)
+            if future is not None:
+                owner = False
+            else:
+                owner = True
+                future = Future()
+                self.pending[key] = future
+
+        # Another client is already encoding this variant - share its result
+        if not owner:
+            return future.result()
+
+        try:
+            data = self._encode(frame, width, quality, fmt)
+        except Exception as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            if data is not None:
+                self.cache[key] = data
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+            del self.pending[key]
+
+        future.set_result(data)
+        return data
+
+    def clear(self):
+        """Drop all cached variants"""
+        with self.lock:
+            self.cache.clear()
+
+    def _encode(self, frame, width, quality, fmt):
+        """Resize and encode a single frame variant"""
+        # Downscale before encoding so thumbnails only pay for the pixels they keep
+        if width is not None and width < frame.shape[1]:
+            height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        if fmt == 'jpeg' and self.turbo is not None:
+            try:
+                return self.turbo.encode(frame, quality=quality,
+                                         pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+            except Exception as e:
+                logger.warning(f"TurboJPEG encode failed, using OpenCV: {str(e)}")
+
+        if fmt == 'webp':
+            ret, buf = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        else:
+            ret, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+        if not ret:
+            return None
+
+        return buf.tobytes()
@@ -0,0 +1,129 @@
+import math
+import threading
+from collections import deque
+
+from detection.projection import METERS_PER_DEG_LAT
+
+
+class DetectionHistory:
+    """
+    Bounded ring buffer of detection snapshots.
+    Every processed frame gets a sequence number, so clients can ask for just
+    what they haven't seen yet, or for an aggregate over a recent time window.
+    """
+
+    def __init__(self, capacity=300, merge_distance=1.0):
+        """
+        Initialize the detection history.
+
+        Args:
+            capacity (int): Maximum number of snapshots kept
+            merge_distance (float): Detections of the same class within this many meters
+                are treated as the same track when aggregating over a window
+        """
+        self.capacity = capacity
+        self.merge_distance = merge_distance
+        self.lock = threading.Lock()
+        self.snapshots = deque(maxlen=capacity)
+        self.last_seq = 0
+
+    def add(self, objects, timestamp):
+        """
+        Record the detections from one processed frame.
+
+        Args:
+            objects (list): Detected objects
+            timestamp (float): Capture time of the frame
+
+        Returns:
+            int: Sequence number of the new snapshot
+        """
+        with self.lock:
+            self.last_seq += 1
+            self.snapshots.append({
+                'seq': self.last_seq,
+                'timestamp': timestamp,
+                'objects': objects
+            })
+            return self.last_seq
+
+    def clear(self):
+        """Drop all snapshots (sequence numbers keep increasing)"""
+        with self.lock:
+            self.snapshots.clear()
+
+    def since(self, seq):
+        """
+        Get snapshots newer than a sequence number.
+
+        Args:
+            seq (int): Last sequence number the client has seen
+
+        Returns:
+            tuple: (snapshots, truncated) where truncated is True if some snapshots
+                after seq have already been evicted from the buffer
+        """
+        with self.lock:
+            # A sequence number from the future means the server restarted - resend everything
+            if seq > self.last_seq:
+                return list(self.snapshots), True
+
+            if not self.snapshots:
+                return [], seq < self.last_seq
+
+            # Sequence numbers are contiguous, so the start index is a subtraction
+            first_seq = self.snapshots[0]['seq']
+            start = max(0, seq + 1 - first_seq)
+            snapshots = [self.snapshots[i] for i in range(start, len(self.snapshots))]
+            return snapshots, seq + 1 < first_seq
+
+    def window(self, seconds, now):
+        """
+        Aggregate the detections of the last few seconds into one object per track.
+        Each detection joins the nearest track of the same class within merge_distance
+        meters (or starts a new one); the entry with the highest confidence is reported,
+        along with how often and when it was last seen.
+
+        Args:
+            seconds (float): Length of the window
+            now (float): Current time
+
+        Returns:
+            list: Aggregated objects, highest confidence first
+        """
+        cutoff = now - seconds
+
+        with self.lock:
+            snapshots = [s for s in reversed(self.snapshots) if s['timestamp'] >= cutoff]
+
+        # Per class: list of (x, y, track) with the track's anchor position in meters
+        tracks_by_class = {}
+        tracks = []
+        for snapshot in snapshots:
+            for obj in snapshot['objects']:
+                x, y = self._to_meters(obj['position'])
+                candidates = tracks_by_class.setdefault(obj['class'], [])
+
+                track = None
+                best = self.merge_distance
+                for tx, ty, candidate in candidates:
+                    distance = math.hypot(x - tx, y - ty)
+                    if distance <= best:
+                        best = distance
+                        track = candidate
+
+                if track is None:
+                    # Snapshots are newest first, so the first sighting is the latest
+                    track = dict(obj, seen=0, last_seen=snapshot['timestamp'])
+                    candidates.append((x, y, track))
+                    tracks.append(track)
+                elif obj['confidence'] > track['confidence']:
+                    track.update(obj)
+                track['seen'] += 1
+
+        return sorted(tracks, key=lambda obj: obj['confidence'], reverse=True)
+
+    def _to_meters(self, position):
+        """Convert a (lat, lon) position to approximate planar meters"""
+        lat, lon = position
+        return lon * METERS_PER_DEG_LAT * math.cos(math.radians(lat)), lat * METERS_PER_DEG_LAT
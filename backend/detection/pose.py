@@ -0,0 +1,252 @@
+import time
+import socket
+import struct
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# UDP pose packets are a sequence of little-endian float64 (timestamp, lat, lon, heading) records
+POSE_RECORD = struct.Struct('<4d')
+
+
+class PoseBuffer:
+    """
+    Fixed-size, time-indexed ring buffer of robot poses.
+    In-order batches are written with a handful of numpy slice assignments and lookups
+    are a binary search, so high-rate GPS/odometry never slows down detection. Batches
+    that reach back before the newest pose (e.g. GPS and odometry from separate senders)
+    are merged into the time-sorted ring instead.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Initialize the pose buffer.
+
+        Args:
+            capacity (int): Number of poses kept (e.g. 1024 is ~20s at 50Hz)
+        """
+        self.capacity = capacity
+        self.lock = threading.Lock()
+
+        # Columns: timestamp, latitude, longitude, heading (degrees clockwise from north)
+        self.data = np.zeros((capacity, 4), dtype=np.float64)
+        self.write_index = 0
+        self.count = 0
+
+    def add_batch(self, poses):
+        """
+        Append a batch of poses.
+
+        Args:
+            poses (array-like): N x 4 array of (timestamp, lat, lon, heading) rows.
+                Timestamps are Unix seconds on the server clock
+
+        Returns:
+            int: Number of poses stored (non-finite samples, and samples older than everything
+                kept in a full buffer, are dropped)
+        """
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 4)
+
+        # A single NaN timestamp would become `latest` and block every later pose
+        poses = poses[np.isfinite(poses).all(axis=1)]
+        if len(poses) == 0:
+            return 0
+
+        # Keep the ring sorted by time
+        poses = poses[np.argsort(poses[:, 0], kind='stable')]
+
+        with self.lock:
+            if self.count:
+                latest = self.data[(self.write_index - 1) % self.capacity, 0]
+                if poses[0, 0] <= latest:
+                    return self._merge(poses)
+
+            # Only the newest `capacity` samples can survive anyway
+            poses = poses[-self.capacity:]
+            n = len(poses)
+
+            first = min(n, self.capacity - self.write_index)
+            self.data[self.write_index:self.write_index + first] = poses[:first]
+            self.data[:n - first] = poses[first:]
+
+            self.write_index = (self.write_index + n) % self.capacity
+            self.count = min(self.capacity, self.count + n)
+
+        return n
+
+    def _merge(self, poses):
+        """Merge a sorted batch that overlaps the buffered range (caller holds the lock)"""
+        oldest = (self.write_index - self.count) % self.capacity
+        existing = np.roll(self.data, -oldest, axis=0)[:self.count]
+        combined = np.concatenate([existing, poses])
+
+        # Stable sort keeps existing samples ahead of new ones with the same timestamp
+        order = np.argsort(combined[:, 0], kind='stable')[-self.capacity:]
+        stored = int((order >= self.count).sum())
+
+        n = len(order)
+        self.data[:n] = combined[order]
+        self.write_index = n % self.capacity
+        self.count = n
+        return stored
+
+    def latest(self):
+        """Get the most recent pose as (timestamp, lat, lon, heading), or None if empty"""
+        with self.lock:
+            if not self.count:
+                return None
+            return tuple(self.data[(self.write_index - 1) % self.capacity])
+
+    def interpolate(self, timestamp):
+        """
+        Get the pose at a given time, linearly interpolated between the surrounding samples.
+        Times outside the buffered range are clamped to the oldest/newest pose.
+
+        Args:
+            timestamp (float): Unix time to look up (e.g. a frame's capture time)
+
+        Returns:
+            tuple: (lat, lon, heading), or None if no poses have been received
+        """
+        with self.lock:
+            if not self.count:
+                return None
+
+            oldest = (self.write_index - self.count) % self.capacity
+            times = self.data[:, 0]
+
+            # The ring is sorted in logical order; it is split into at most two physical segments
+            first_len = min(self.count, self.capacity - oldest)
+            if self.count > first_len and timestamp >= times[0]:
+                j = first_len + int(np.searchsorted(times[:self.count - first_len], timestamp, side='right'))
+            else:
+                j = int(np.searchsorted(times[oldest:oldest + first_len], timestamp, side='right'))
+
+            if j == 0:
+                return tuple(self.data[oldest, 1:])
+            if j == self.count:
+                return tuple(self.data[(oldest + j - 1) % self.capacity, 1:])
+
+            before = self.data[(oldest + j - 1) % self.capacity].copy()
+            after = self.data[(oldest + j) % self.capacity].copy()
+
+        span = after[0] - before[0]
+        alpha = (timestamp - before[0]) / span if span > 0 else 0.0
+
+        lat = before[1] + alpha * (after[1] - before[1])
+        lon = before[2] + alpha * (after[2] - before[2])
+        # Interpolate heading the short way round
+        turn = (after[3] - before[3] + 180.0) % 360.0 - 180.0
+        heading = (before[3] + alpha * turn) % 360.0
+
+        return lat, lon, heading
+
+
+def parse_poses(data):
+    """
+    Convert a JSON pose payload into an N x 4 array.
+
+    Accepts either {"poses": [[t, lat, lon, heading], ...]} or columnar
+    {"t": [...], "lat": [...], "lon": [...], "heading": [...]}. A missing
+    timestamp means "now" and a missing heading means 0.
+
+    Raises:
+        ValueError: If the payload doesn't contain any poses or has non-finite values
+    """
+    if 'poses' in data:
+        rows = data['poses']
+        now = time.time()
+        poses = np.array([
+            [row[0] if row[0] is not None else now, row[1], row[2], row[3] if len(row) > 3 else 0.0]
+            for row in rows
+        ], dtype=np.float64)
+    elif 'lat' in data and 'lon' in data:
+        lat = np.asarray(data['lat'], dtype=np.float64).reshape(-1)
+        lon = np.asarray(data['lon'], dtype=np.float64).reshape(-1)
+        t = np.asarray(data['t'], dtype=np.float64).reshape(-1) if 't' in data else np.full(len(lat), time.time())
+        heading = np.asarray(data['heading'], dtype=np.float64).reshape(-1) if 'heading' in data else np.zeros(len(lat))
+        poses = np.stack([t, lat, lon, heading], axis=1)
+    else:
+        raise ValueError("Expected 'poses' rows or 'lat'/'lon' columns")
+
+    if poses.size == 0:
+        raise ValueError("No poses provided")
+
+    poses = poses.reshape(-1, 4)
+    if not np.isfinite(poses).all():
+        raise ValueError("Poses must not contain NaN or infinite values")
+
+    return poses
+
+
+class PoseListener:
+    """
+    Receives binary pose batches over UDP and writes them straight into a PoseBuffer.
+    Each datagram holds one or more POSE_RECORD entries.
+    """
+
+    def __init__(self, pose_buffer, host='0.0.0.0', port=5005):
+        """
+        Initialize the UDP pose listener.
+
+        Args:
+            pose_buffer (PoseBuffer): Buffer to write received poses into
+            host (str): Interface to bind to
+            port (int): UDP port to listen on
+        """
+        self.pose_buffer = pose_buffer
+        self.host = host
+        self.port = port
+        self.is_running = False
+        self.thread = None
+        self.sock = None
+
+    def start(self):
+        """Start listening in a background thread"""
+        if self.is_running:
+            return False
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.sock.settimeout(0.5)
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._listen_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Listening for poses on udp://{self.host}:{self.port}")
+        return True
+
+    def stop(self):
+        """Stop listening"""
+        self.is_running = False
+
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+        return True
+
+    def _listen_loop(self):
+        """Receive loop that runs in a separate thread"""
+        while self.is_running:
+            try:
+                packet = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            usable = len(packet) - len(packet) % POSE_RECORD.size
+            if usable == 0:
+                logger.warning(f"Ignoring malformed pose packet ({len(packet)} bytes)")
+                continue
+
+            poses = np.frombuffer(packet[:usable], dtype='<f8').reshape(-1, 4)
+            self.pose_buffer.add_batch(poses)
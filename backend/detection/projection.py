@@ -0,0 +1,301 @@
+import cv2
+import json
+import math
+import copy
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Meters per degree of latitude (close enough everywhere for local offsets)
+METERS_PER_DEG_LAT = 111320.0
+
+# Nominal camera used when no calibration is configured: 640x480, ~60 degree
+# horizontal field of view, mounted 1m above the ground and pitched down 15 degrees
+DEFAULT_CALIBRATION = {
+    'image_size': [640, 480],
+    'camera_matrix': [[554.0, 0.0, 320.0], [0.0, 554.0, 240.0], [0.0, 0.0, 1.0]],
+    'dist_coeffs': [0.0, 0.0, 0.0, 0.0, 0.0],
+    'mounting': {'height': 1.0, 'pitch_deg': 15.0},
+    'max_range': 50.0,
+    'cell_size': 4
+}
+
+
+def load_calibration(path):
+    """
+    Load a camera calibration from a JSON file.
+
+    The file may contain:
+        image_size: [width, height] the calibration was made at
+        camera_matrix: 3x3 intrinsics
+        dist_coeffs: OpenCV distortion coefficients (optional)
+        homography: 3x3 map from undistorted pixels to ground meters [right, forward] (optional)
+        mounting: {height, pitch_deg} used to derive the homography if none is given
+        max_range: Ground distance in meters that projections are clamped to
+        cell_size: Lookup table cell size in pixels
+
+    Missing keys fall back to DEFAULT_CALIBRATION.
+    """
+    with open(path) as f:
+        calibration = json.load(f)
+
+    return validate_calibration(merge_calibration(DEFAULT_CALIBRATION, calibration))
+
+
+def merge_calibration(base, update):
+    """
+    Overlay a (partial) calibration onto another.
+    `mounting` is merged key by key so e.g. only the pitch can be changed.
+
+    Args:
+        base (dict): Complete calibration to start from
+        update (dict): Keys to replace
+
+    Returns:
+        dict: New merged calibration (neither input is modified)
+    """
+    if not isinstance(update, dict):
+        raise ValueError("Calibration must be a JSON object")
+
+    merged = copy.deepcopy(base)
+    for key, value in update.items():
+        if key == 'mounting' and isinstance(value, dict) and isinstance(merged.get('mounting'), dict):
+            merged['mounting'].update(value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _matrix(value, shape, name):
+    """Convert a value to a finite float matrix of the given shape"""
+    try:
+        matrix = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be numeric")
+    if matrix.shape != shape or not np.isfinite(matrix).all():
+        raise ValueError(f"{name} must be a finite {shape[0]}x{shape[1]} matrix")
+    return matrix
+
+
+def _positive(value, name):
+    """Check a value is a finite positive number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{name} must be a positive number")
+    return value
+
+
+def validate_calibration(calibration):
+    """
+    Check a complete calibration before it is used to build a lookup table.
+
+    Args:
+        calibration (dict): Calibration (see load_calibration)
+
+    Returns:
+        dict: The same calibration
+
+    Raises:
+        ValueError: If any value is missing, malformed or out of range
+    """
+    try:
+        image_size = calibration['image_size']
+        if (not isinstance(image_size, list) or len(image_size) != 2
+                or not all(isinstance(v, int) and not isinstance(v, bool) and v > 0 for v in image_size)):
+            raise ValueError("image_size must be [width, height] with positive integers")
+
+        cell_size = calibration['cell_size']
+        if isinstance(cell_size, bool) or not isinstance(cell_size, int) or cell_size <= 0:
+            raise ValueError("cell_size must be a positive integer")
+
+        _positive(calibration['max_range'], 'max_range')
+
+        camera_matrix = _matrix(calibration['camera_matrix'], (3, 3), 'camera_matrix')
+        if camera_matrix[0, 0] <= 0 or camera_matrix[1, 1] <= 0:
+            raise ValueError("camera_matrix focal lengths must be positive")
+
+        dist_coeffs = calibration.get('dist_coeffs')
+        if dist_coeffs:
+            coeffs = _matrix(dist_coeffs, (len(dist_coeffs),), 'dist_coeffs')
+            if len(coeffs) not in (4, 5, 8, 12, 14):
+                raise ValueError("dist_coeffs must have 4, 5, 8, 12 or 14 values")
+
+        if calibration.get('homography') is not None:
+            homography = _matrix(calibration['homography'], (3, 3), 'homography')
+            if abs(np.linalg.det(homography)) < 1e-12:
+                raise ValueError("homography must be invertible")
+        else:
+            mounting = calibration['mounting']
+            if not isinstance(mounting, dict):
+                raise ValueError("mounting must be an object with height and pitch_deg")
+            _positive(mounting['height'], 'mounting.height')
+            pitch = mounting['pitch_deg']
+            if isinstance(pitch, bool) or not isinstance(pitch, (int, float)) or not -90 < pitch < 90:
+                raise ValueError("mounting.pitch_deg must be a number between -90 and 90")
+    except KeyError as e:
+        raise ValueError(f"Missing calibration key: {e.args[0]}")
+    except TypeError as e:
+        raise ValueError(f"Malformed calibration: {str(e)}")
+
+    return calibration
+
+
+def mounting_homography(camera_matrix, height, pitch_deg):
+    """
+    Build the ground-plane homography for a camera at a given height and downward pitch.
+
+    Args:
+        camera_matrix (ndarray): 3x3 intrinsics
+        height (float): Camera height above the ground in meters
+        pitch_deg (float): Downward tilt of the optical axis in degrees
+
+    Returns:
+        ndarray: 3x3 homography from undistorted pixels to ground meters [right, forward]
+    """
+    pitch = math.radians(pitch_deg)
+    # Rotates a camera ray (x right, y down, z forward) into ground coordinates
+    # scaled so that the third component is the ray's downward slope
+    ray_to_ground = np.array([
+        [height, 0.0, 0.0],
+        [0.0, -height * math.sin(pitch), height * math.cos(pitch)],
+        [0.0, math.cos(pitch), math.sin(pitch)]
+    ])
+    return ray_to_ground @ np.linalg.inv(camera_matrix)
+
+
+class GroundProjector:
+    """
+    Projects image pixels onto the ground plane using a precomputed lookup table.
+    The table holds the ground offset in meters (right, forward) of every cell of
+    the calibrated image, so projecting a batch of points is a single array gather.
+    """
+
+    def __init__(self, calibration=None):
+        """
+        Initialize the projector.
+
+        Args:
+            calibration (dict): Camera calibration (see load_calibration), or None for the default camera
+        """
+        # (calibration, table) pair, replaced as a whole so readers never mix the two
+        self.lut = None
+        self.set_calibration(calibration or DEFAULT_CALIBRATION)
+
+    @property
+    def calibration(self):
+        """The calibration the current lookup table was built from"""
+        return self.lut[0] if self.lut else None
+
+    def set_calibration(self, calibration):
+        """
+        Use a new calibration, rebuilding the lookup table only if it actually changed.
+
+        Returns:
+            bool: True if the table was rebuilt
+
+        Raises:
+            ValueError: If the calibration is invalid (the current table is kept)
+        """
+        if calibration == self.calibration:
+            return False
+
+        validate_calibration(calibration)
+
+        table = self._build_table(calibration)
+
+        self.lut = (copy.deepcopy(calibration), table)
+        logger.info(f"Built ground lookup table {table.shape[1]}x{table.shape[0]} "
+                    f"(cell size {calibration['cell_size']}px)")
+        return True
+
+    def _build_table(self, calibration):
+        """Compute the ground offset of every lookup table cell centre"""
+        width, height = calibration['image_size']
+        cell = int(calibration['cell_size'])
+        max_range = float(calibration['max_range'])
+        camera_matrix = np.asarray(calibration['camera_matrix'], dtype=np.float64)
+        dist_coeffs = np.asarray(calibration.get('dist_coeffs') or [0.0] * 5, dtype=np.float64)
+
+        if calibration.get('homography') is not None:
+            homography = np.asarray(calibration['homography'], dtype=np.float64)
+        else:
+            mounting = calibration['mounting']
+            homography = mounting_homography(camera_matrix, mounting['height'], mounting['pitch_deg'])
+
+        # Cell centres in distorted (raw image) pixel coordinates
+        xs = np.arange(0, width, cell, dtype=np.float64) + cell / 2
+        ys = np.arange(0, height, cell, dtype=np.float64) + cell / 2
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        pixels = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)
+
+        # Remove lens distortion, keeping pixel units
+        undistorted = cv2.undistortPoints(pixels.reshape(-1, 1, 2), camera_matrix, dist_coeffs,
+                                          P=camera_matrix).reshape(-1, 2)
+
+        ground = np.hstack([undistorted, np.ones((len(undistorted), 1))]) @ homography.T
+        w = ground[:, 2]
+        below_horizon = w > 1e-9
+        safe_w = np.where(below_horizon, w, 1.0)
+        right = ground[:, 0] / safe_w
+        forward = ground[:, 1] / safe_w
+
+        # Points at or above the horizon, or too far away, are clamped to max_range
+        # along their horizontal bearing
+        distance = np.hypot(right, forward)
+        clamp = ~below_horizon | (distance > max_range)
+        bearing = np.where(below_horizon, np.arctan2(right, forward),
+                           np.arctan2(ground[:, 0], np.abs(ground[:, 1]) + 1e-9))
+        right = np.where(clamp, max_range * np.sin(bearing), right)
+        forward = np.where(clamp, max_range * np.cos(bearing), forward)
+
+        table = np.stack([right, forward], axis=1).astype(np.float32)
+        return table.reshape(len(ys), len(xs), 2)
+
+    def project(self, points, frame_shape):
+        """
+        Look up the ground offsets of a batch of pixels.
+
+        Args:
+            points (ndarray): N x 2 array of (x, y) pixel coordinates
+            frame_shape (tuple): Shape of the frame the points come from
+
+        Returns:
+            ndarray: N x 2 array of (right, forward) offsets from the camera in meters
+        """
+        calibration, table = self.lut
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+
+        # Frames may arrive at a different resolution than the calibration
+        width, height = calibration['image_size']
+        scale = np.array([width / frame_shape[1], height / frame_shape[0]], dtype=np.float32)
+        cells = (points * scale / calibration['cell_size']).astype(int)
+
+        ix = np.clip(cells[:, 0], 0, table.shape[1] - 1)
+        iy = np.clip(cells[:, 1], 0, table.shape[0] - 1)
+        return table[iy, ix]
+
+
+def offsets_to_latlon(offsets, lat, lon, heading_deg=0.0):
+    """
+    Convert camera-relative ground offsets to latitude/longitude.
+
+    Args:
+        offsets (ndarray): N x 2 array of (right, forward) offsets in meters
+        lat (float): Latitude of the camera
+        lon (float): Longitude of the camera
+        heading_deg (float): Direction the camera faces, in degrees clockwise from north
+
+    Returns:
+        ndarray: N x 2 array of (latitude, longitude)
+    """
+    heading = math.radians(heading_deg)
+    # Work in float64 - float32 can't resolve sub-meter steps at these magnitudes
+    offsets = np.asarray(offsets, dtype=np.float64)
+    right, forward = offsets[:, 0], offsets[:, 1]
+
+    north = forward * math.cos(heading) - right * math.sin(heading)
+    east = forward * math.sin(heading) + right * math.cos(heading)
+
+    latitudes = lat + north / METERS_PER_DEG_LAT
+    longitudes = lon + east / (METERS_PER_DEG_LAT * math.cos(math.radians(lat)))
+    return np.stack([latitudes, longitudes], axis=1)
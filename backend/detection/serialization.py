@@ -0,0 +1,177 @@
+import json
+import struct
+import numpy as np
+
+# orjson and msgpack are optional - JSON falls back to the standard library,
+# and MessagePack is simply not offered without msgpack
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Whether dumps_json uses the fast serializer
+FAST_JSON = orjson is not None
+
+# Response formats for detected objects and their mimetypes
+OBJECT_FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.detection.columnar+json',
+    'msgpack': 'application/msgpack',
+    'binary': 'application/octet-stream'
+}
+
+# Binary layout header: magic, version, flags, class name count, object count, seq
+BINARY_MAGIC = b'DETS'
+BINARY_VERSION = 2
+BINARY_HEADER = struct.Struct('<4sBBHIQ')
+
+# Header flag bits
+BINARY_FLAG_STALE = 0x01
+BINARY_FLAG_TRACKS = 0x02
+
+
+def available_formats():
+    """Get the object formats that can be produced with the installed packages"""
+    return [fmt for fmt in OBJECT_FORMATS if fmt != 'msgpack' or msgpack is not None]
+
+
+def dumps_json(obj):
+    """Serialize to compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def to_columns(objects):
+    """
+    Convert a list of detected objects into parallel arrays.
+
+    Class names are stored once in `class_names` and referenced by index from
+    `class_ids`. Boxes and positions are flattened (4 and 2 values per object).
+    Aggregated window results also get their `seen` and `last_seen` columns.
+
+    Args:
+        objects (list): Detected objects as returned by ObjectDetector
+
+    Returns:
+        dict: Columnar representation of the objects
+    """
+    class_names = []
+    class_index = {}
+    class_ids = []
+    for obj in objects:
+        name = obj['class']
+        if name not in class_index:
+            class_index[name] = len(class_names)
+            class_names.append(name)
+        class_ids.append(class_index[name])
+
+    columns = {
+        'count': len(objects),
+        'class_names': class_names,
+        'class_ids': class_ids,
+        'scores': [obj['confidence'] for obj in objects],
+        'boxes': [v for obj in objects for v in obj['bbox']],
+        'positions': [v for obj in objects for v in obj['position']],
+        'radii': [obj['radius'] for obj in objects],
+        'is_obstacle': [bool(obj['is_obstacle']) for obj in objects]
+    }
+
+    if objects and all('seen' in obj for obj in objects):
+        columns['seen'] = [obj['seen'] for obj in objects]
+        columns['last_seen'] = [obj['last_seen'] for obj in objects]
+
+    return columns
+
+
+def to_binary(objects, seq=0, stale=False):
+    """
+    Pack detected objects into a raw little-endian binary layout.
+
+    Layout:
+        header: magic 'DETS', uint8 version, uint8 flags (BINARY_FLAG_*), uint16 class name count,
+            uint32 object count (N), uint64 seq
+        class names: for each, uint8 length + UTF-8 bytes
+        uint16[N] class ids, float32[N] scores, int32[N*4] boxes,
+        float64[N*2] positions (lat, lon), float32[N] radii, uint8[N] is_obstacle
+        if BINARY_FLAG_TRACKS is set: uint32[N] seen, float64[N] last_seen
+
+    Args:
+        objects (list): Detected objects as returned by ObjectDetector
+        seq (int): Sequence number of the snapshot
+        stale (bool): Whether the detections are from a stale frame
+
+    Returns:
+        bytes: Packed objects
+    """
+    columns = to_columns(objects)
+    count = columns['count']
+
+    tracks = 'seen' in columns
+    flags = (BINARY_FLAG_STALE if stale else 0) | (BINARY_FLAG_TRACKS if tracks else 0)
+
+    parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags,
+                                len(columns['class_names']), count, seq)]
+    for name in columns['class_names']:
+        encoded = name.encode('utf-8')[:255]
+        parts.append(struct.pack('<B', len(encoded)))
+        parts.append(encoded)
+
+    parts.append(np.asarray(columns['class_ids'], dtype='<u2').tobytes())
+    parts.append(np.asarray(columns['scores'], dtype='<f4').tobytes())
+    parts.append(np.asarray(columns['boxes'], dtype='<i4').tobytes())
+    parts.append(np.asarray(columns['positions'], dtype='<f8').tobytes())
+    parts.append(np.asarray(columns['radii'], dtype='<f4').tobytes())
+    parts.append(np.asarray(columns['is_obstacle'], dtype='u1').tobytes())
+    if tracks:
+        parts.append(np.asarray(columns['seen'], dtype='<u4').tobytes())
+        parts.append(np.asarray(columns['last_seen'], dtype='<f8').tobytes())
+
+    return b''.join(parts)
+
+
+def encode_objects(payload, fmt):
+    """
+    Encode an /objects response payload in the requested format.
+
+    Args:
+        payload (dict): Response with either an 'objects' list or a 'snapshots' list
+            (each holding an 'objects' list), plus metadata such as 'seq' and 'stale'
+        fmt (str): One of OBJECT_FORMATS
+
+    Returns:
+        bytes: Encoded payload
+
+    Raises:
+        ValueError: If the format is unknown or can't represent the payload
+    """
+    if fmt == 'json':
+        return dumps_json(payload)
+
+    if fmt == 'binary':
+        if 'objects' not in payload:
+            raise ValueError("Binary format only supports a single set of objects")
+        return to_binary(payload['objects'], payload.get('seq', 0), payload.get('stale', False))
+
+    # Columnar JSON / MessagePack share the same structure
+    columnar = dict(payload)
+    if 'objects' in columnar:
+        columnar['objects'] = to_columns(columnar['objects'])
+    if 'snapshots' in columnar:
+        columnar['snapshots'] = [dict(snapshot, objects=to_columns(snapshot['objects']))
+                                 for snapshot in columnar['snapshots']]
+
+    if fmt == 'columnar':
+        return dumps_json(columnar)
+
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise ValueError("MessagePack support requires the msgpack package")
+        return msgpack.packb(columnar, use_bin_type=True)
+
+    raise ValueError(f"Unsupported format '{fmt}' (expected one of: {', '.join(available_formats())})")
@@ -0,0 +1,190 @@
+import cv2
+import numpy as np
+
+
+def _axis_starts(length, tile, overlap):
+    """Start offsets along one axis so that tiles cover [0, length) with the given overlap"""
+    if length <= tile:
+        return [0]
+
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, stride))
+    # Last tile is aligned to the edge instead of running past it
+    starts.append(length - tile)
+    return starts
+
+
+def make_tiles(frame_shape, tile_size=640, overlap=0.2, roi_mask=None):
+    """
+    Split a frame into overlapping square tiles.
+
+    Args:
+        frame_shape (tuple): Shape of the frame (height, width, ...)
+        tile_size (int): Tile edge length in pixels
+        overlap (float): Fraction of the tile shared with its neighbour (0-1)
+        roi_mask (ndarray): Optional uint8 mask (height x width), non-zero where detection is wanted
+
+    Returns:
+        list: (x1, y1, x2, y2) tile rectangles, skipping tiles that lie entirely outside the ROI
+    """
+    height, width = frame_shape[:2]
+    tiles = []
+
+    for y in _axis_starts(height, tile_size, overlap):
+        for x in _axis_starts(width, tile_size, overlap):
+            x2 = min(x + tile_size, width)
+            y2 = min(y + tile_size, height)
+            if roi_mask is not None and not roi_mask[y:y2, x:x2].any():
+                continue
+            tiles.append((x, y, x2, y2))
+
+    return tiles
+
+
+def validate_roi_polygons(polygons):
+    """
+    Check region-of-interest polygons supplied by a client.
+
+    Args:
+        polygons (list): Polygons as lists of [x, y] points normalised to [0, 1], or None/[] for the whole frame
+
+    Returns:
+        list: The polygons with all coordinates as floats, or None for the whole frame
+
+    Raises:
+        ValueError: If the structure or values are invalid
+    """
+    if not polygons:
+        return None
+
+    if not isinstance(polygons, list):
+        raise ValueError("roi_polygons must be a list of polygons")
+
+    validated = []
+    for i, polygon in enumerate(polygons):
+        if not isinstance(polygon, list) or len(polygon) < 3:
+            raise ValueError(f"Polygon {i} must be a list of at least 3 [x, y] points")
+
+        points = []
+        for point in polygon:
+            if (not isinstance(point, list) or len(point) != 2
+                    or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in point)):
+                raise ValueError(f"Polygon {i} has a point that is not a numeric [x, y] pair")
+            x, y = float(point[0]), float(point[1])
+            if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+                raise ValueError(f"Polygon {i} has a point outside the normalised [0, 1] range")
+            points.append([x, y])
+        validated.append(points)
+
+    return validated
+
+
+def build_roi_mask(frame_shape, polygons):
+    """
+    Rasterise region-of-interest polygons into a mask.
+
+    Args:
+        frame_shape (tuple): Shape of the frame (height, width, ...)
+        polygons (list): Polygons as lists of [x, y] points, normalised to [0, 1]
+
+    Returns:
+        ndarray: uint8 mask with 255 inside the ROI, or None if no polygons are given
+    """
+    if not polygons:
+        return None
+
+    height, width = frame_shape[:2]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    scale = np.array([width, height], dtype=np.float32)
+
+    for polygon in polygons:
+        points = np.round(np.asarray(polygon, dtype=np.float32) * scale).astype(np.int32)
+        cv2.fillPoly(mask, [points], 255)
+
+    return mask
+
+
+def apply_roi_mask(image, roi_mask):
+    """Black out everything outside the ROI so it contributes nothing to detection"""
+    if roi_mask is None:
+        return image
+    return cv2.bitwise_and(image, image, mask=roi_mask)
+
+
+def filter_by_roi(boxes, roi_mask):
+    """
+    Get a boolean keep-mask for boxes whose centre lies inside the ROI.
+
+    Args:
+        boxes (ndarray): N x 4 array of (x1, y1, x2, y2) boxes in frame coordinates
+        roi_mask (ndarray): uint8 mask, or None to keep everything
+
+    Returns:
+        ndarray: Boolean array of length N
+    """
+    if roi_mask is None or len(boxes) == 0:
+        return np.ones(len(boxes), dtype=bool)
+
+    height, width = roi_mask.shape
+    cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(int), 0, width - 1)
+    cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(int), 0, height - 1)
+    return roi_mask[cy, cx] > 0
+
+
+def merge_detections(boxes, scores, class_ids, score_threshold=0.5, match_threshold=0.5):
+    """
+    Merge detections from overlapping tiles with class-aware greedy box merging.
+
+    A tile that cuts through an object only reports a fragment of it, and the IoU
+    between a fragment and the full box stays low even though one contains the other.
+    Boxes are therefore matched on intersection over the *smaller* box's area, and
+    matched boxes are merged into their union (keeping the highest confidence).
+
+    Args:
+        boxes (ndarray): N x 4 array of (x1, y1, x2, y2) boxes in frame coordinates
+        scores (ndarray): N confidence scores
+        class_ids (ndarray): N class ids
+        score_threshold (float): Minimum confidence to keep
+        match_threshold (float): Intersection over smaller area above which two boxes
+            of the same class are considered the same object
+
+    Returns:
+        tuple: (boxes, scores, class_ids) of the merged detections, sorted by confidence
+    """
+    keep = scores >= score_threshold
+    boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+    if len(boxes) == 0:
+        return boxes, scores, class_ids
+
+    order = np.argsort(-scores, kind='stable')
+    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+
+    merged_boxes, merged_scores, merged_classes = [], [], []
+    remaining = np.ones(len(boxes), dtype=bool)
+
+    for i in range(len(boxes)):
+        if not remaining[i]:
+            continue
+
+        # Same-class boxes not yet merged, including i itself
+        candidates = np.flatnonzero(remaining & (class_ids == class_ids[i]))
+        ix1 = np.maximum(boxes[i, 0], boxes[candidates, 0])
+        iy1 = np.maximum(boxes[i, 1], boxes[candidates, 1])
+        ix2 = np.minimum(boxes[i, 2], boxes[candidates, 2])
+        iy2 = np.minimum(boxes[i, 3], boxes[candidates, 3])
+        intersection = np.maximum(ix2 - ix1, 0) * np.maximum(iy2 - iy1, 0)
+        smaller = np.maximum(np.minimum(areas[i], areas[candidates]), 1e-9)
+
+        group = candidates[intersection / smaller >= match_threshold]
+        group = np.union1d(group, [i])
+        remaining[group] = False
+
+        merged_boxes.append([boxes[group, 0].min(), boxes[group, 1].min(),
+                             boxes[group, 2].max(), boxes[group, 3].max()])
+        merged_scores.append(scores[i])
+        merged_classes.append(class_ids[i])
+
+    return (np.asarray(merged_boxes, dtype=boxes.dtype),
+            np.asarray(merged_scores, dtype=scores.dtype),
+            np.asarray(merged_classes, dtype=class_ids.dtype))